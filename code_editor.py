@@ -2,30 +2,47 @@ from PySide6.QtWidgets import QPlainTextEdit, QCompleter, QApplication, QTextEdi
 from PySide6.QtGui import QTextCharFormat, QColor, QTextCursor, QKeyEvent, QFont, QSyntaxHighlighter
 from PySide6.QtCore import Qt, QTimer, QStringListModel, QRect, QRegularExpression, QFileInfo, Signal, Slot
 import json
+import logging
 import os
 import sys
+import difflib
 from PySide6.QtCore import QThreadPool # Import QThreadPool
 
 # Import worker threads
 from worker_threads import JediCompletionWorker, PyflakesLinterWorker, WorkerSignals
 
 from python_highlighter import PythonHighlighter # Import the dedicated highlighter
+from text_delta import utf16_len, compute_qt_text_delta
+
+log = logging.getLogger(__name__)
+
+_UNRESOLVED = object() # Sentinel: no lexer has been resolved yet
+
 
 class CodeEditor(QPlainTextEdit):
     cursor_position_changed_signal = Signal(int, int) # Line, Column
     language_changed_signal = Signal(str)
     control_reclaim_requested = Signal() # New signal for host to reclaim control
 
+    HIGHLIGHT_SIZE_LIMIT = 512 * 1024 # Bytes on disk; larger files open with highlighting disabled
+    STREAM_LOAD_THRESHOLD = 50 * 1024 * 1024 # Bytes; larger files are read into the document in chunks
+    DIFF_LINE_LIMIT = 8000 # Changed lines (old + new); apply_text_diff replaces larger changes as one span
+    LOAD_CHUNK_SIZE = 1024 * 1024 # Characters per chunk when streaming a large file
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setTabStopDistance(4 * self.fontMetrics().averageCharWidth())
         self.file_path = None
+        self._base_name = "Untitled" # Tab title without the dirty marker, cached when file_path changes
         self.current_language = "Plain Text"
 
         self.theme_config = self._load_theme_config()
         self._apply_editor_theme()
 
         self.highlighter = PythonHighlighter(self.document(), self.theme_config) # Use PythonHighlighter
+        self.highlighting_enabled = True
+        self._lexer_path = _UNRESOLVED # file_path the current lexer was resolved for
+        self.formatted_text = None # Last text known to be Black-formatted; saves skip Black while it still matches
         self.thread_pool = QThreadPool.globalInstance() # Get global thread pool
         self.setup_linter()
         self.setup_completer()
@@ -40,12 +57,24 @@ class CodeEditor(QPlainTextEdit):
         }
         self.CLOSING_CHARS = set(self.PAIRS.values())
 
+        # Invalidate on contentsChange: it is emitted before contentsChanged/textChanged,
+        # so no textChanged handler can ever see a stale cached string.
+        self._plain_text_cache = None
+        self.document().contentsChange.connect(self._invalidate_plain_text_cache)
+
+        # Span edited since mark_change_baseline(), in UTF-16 positions as reported by contentsChange:
+        # everything before _changed_start and the last _unchanged_tail positions are untouched.
+        self._baseline_length = 0
+        self._changed_start = None
+        self._unchanged_tail = 0
+        self.document().contentsChange.connect(self._track_changed_span)
+
         self.textChanged.connect(self._update_language_and_highlighting)
         self.cursorPositionChanged.connect(self._emit_cursor_position)
         self._is_programmatic_change = False # Master control flag
 
     def _load_theme_config(self):
-        print("LOG: CodeEditor._load_theme_config - Entry")
+        log.debug("CodeEditor._load_theme_config - Entry")
         config_path = os.path.join(os.path.dirname(__file__), 'config', 'theme.json')
         try:
             with open(config_path, 'r') as f:
@@ -60,10 +89,10 @@ class CodeEditor(QPlainTextEdit):
             sys.stderr.write(f"An unexpected error occurred loading theme config from {config_path}: {e}\n")
             return {}
         finally:
-            print("LOG: CodeEditor._load_theme_config - Exit")
+            log.debug("CodeEditor._load_theme_config - Exit")
 
     def _apply_editor_theme(self):
-        print("LOG: CodeEditor._apply_editor_theme - Entry")
+        log.debug("CodeEditor._apply_editor_theme - Entry")
         editor_theme = self.theme_config.get("editor", {})
         bg_color = editor_theme.get("background", "#282c34")
         fg_color = editor_theme.get("foreground", "#abb2bf")
@@ -80,13 +109,25 @@ class CodeEditor(QPlainTextEdit):
                 background-color: {bg_color};
             }}
         """)
-        print("LOG: CodeEditor._apply_editor_theme - Exit")
+        log.debug("CodeEditor._apply_editor_theme - Exit")
 
     def _update_language_and_highlighting(self):
-        print("LOG: CodeEditor._update_language_and_highlighting - Entry")
+        log.debug("CodeEditor._update_language_and_highlighting - Entry")
         if self._is_programmatic_change:
-            print("LOG: CodeEditor._update_language_and_highlighting - Programmatic change, skipping.")
+            log.debug("CodeEditor._update_language_and_highlighting - Programmatic change, skipping.")
+            return
+
+        if not self.highlighting_enabled:
+            # Large-file mode: skip lexer guessing and full-document rehighlights.
+            self.linter_timer.start()
+            return
+
+        if self.file_path == self._lexer_path:
+            # Same file, same lexer: QSyntaxHighlighter already rehighlights just the edited
+            # blocks, so only the linter needs kicking.
+            self.linter_timer.start()
             return
+        self._lexer_path = self.file_path
 
         old_language = self.current_language
         
@@ -109,18 +150,160 @@ class CodeEditor(QPlainTextEdit):
             self.language_changed_signal.emit(self.current_language)
         
         self.linter_timer.start()
-        print("LOG: CodeEditor._update_language_and_highlighting - Exit")
+        log.debug("CodeEditor._update_language_and_highlighting - Exit")
+
+    def set_highlighting_enabled(self, enabled):
+        """Attaches or detaches the syntax highlighter from this editor's document."""
+        if enabled == self.highlighting_enabled:
+            return
+        self.highlighting_enabled = enabled
+        if enabled:
+            self._lexer_path = _UNRESOLVED # Force a fresh lexer lookup
+            # Resolve the lexer while still detached, so its rehighlight() is a no-op;
+            # attaching the document then highlights it exactly once.
+            self._update_language_and_highlighting()
+            self.highlighter.setDocument(self.document())
+        else:
+            self.highlighter.setDocument(None)
+
+    def plain_text(self):
+        """toPlainText(), materialized at most once per document change."""
+        if self._plain_text_cache is None:
+            self._plain_text_cache = self.toPlainText()
+        return self._plain_text_cache
+
+    @Slot(int, int, int)
+    def _invalidate_plain_text_cache(self, position, chars_removed, chars_added):
+        self._plain_text_cache = None
+
+    @Slot(int, int, int)
+    def _track_changed_span(self, position, chars_removed, chars_added):
+        length = self.document().characterCount() - 1
+        previous_length = length - chars_added + chars_removed
+        # Qt can over-report the range (e.g. past the final paragraph separator); clamping only widens the span.
+        tail = max(0, previous_length - position - chars_removed)
+        position = min(position, length)
+        if self._changed_start is None:
+            self._changed_start, self._unchanged_tail = position, tail
+        else:
+            self._changed_start = min(self._changed_start, position)
+            self._unchanged_tail = min(self._unchanged_tail, tail)
+
+    def mark_change_baseline(self):
+        """Treats the current text as the reference point for changed_span()."""
+        self._baseline_length = self.document().characterCount() - 1
+        self._changed_start = None
+
+    def changed_span(self):
+        """
+        Returns (start, end, text, base_length) such that replacing [start, end) of the baseline text
+        with text yields the current text, or None if nothing was edited. Costs O(span), not O(document).
+        """
+        if self._changed_start is None:
+            return None
+        document = self.document()
+        new_end = document.characterCount() - 1 - self._unchanged_tail
+        old_end = self._baseline_length - self._unchanged_tail
+        if new_end == self._changed_start == old_end:
+            return None # e.g. a character typed and deleted again before the flush; nothing to send
+        cursor = QTextCursor(document)
+        cursor.setPosition(self._changed_start)
+        cursor.setPosition(new_end, QTextCursor.KeepAnchor)
+        # The fragment converts paragraph separators back to '\n', matching toPlainText().
+        text = cursor.selection().toPlainText()
+        return self._changed_start, old_end, text, self._baseline_length
+
+    def load_file(self, file_path):
+        """
+        Loads file_path into the document. Files above STREAM_LOAD_THRESHOLD are decoded and
+        inserted chunk by chunk inside one edit block, so the whole file never exists as a
+        single Python string next to the document. Raises the same OSError/UnicodeDecodeError
+        as open() so callers can report them.
+        """
+        file_size = os.path.getsize(file_path)
+        if file_size > self.HIGHLIGHT_SIZE_LIMIT:
+            self.set_highlighting_enabled(False) # Detach before loading to avoid a full rehighlight
+            # Wrapping makes every block's height depend on the viewport width, so a resize re-lays out
+            # the whole document; without it each block is one line and only visible blocks are laid out.
+            self.setLineWrapMode(QPlainTextEdit.NoWrap)
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if file_size <= self.STREAM_LOAD_THRESHOLD:
+                self.setPlainText(f.read())
+                return
+
+            document = self.document()
+            document.setUndoRedoEnabled(False) # Loading is not an undoable edit, same as setPlainText
+            self.clear()
+            cursor = QTextCursor(document)
+            cursor.beginEditBlock()
+            try:
+                for chunk in iter(lambda: f.read(self.LOAD_CHUNK_SIZE), ''):
+                    cursor.insertText(chunk)
+            finally: # A decode error mid-file must not leave the edit block open or undo disabled
+                cursor.endEditBlock()
+                document.setUndoRedoEnabled(True)
+            document.setModified(False)
+            self.moveCursor(QTextCursor.Start)
+
+    def apply_text_diff(self, new_text):
+        """
+        Replaces the document text with new_text by editing only the lines that differ.
+        Unlike setPlainText this keeps the undo history, leaves the user's cursor in place
+        and lets the highlighter re-run only on the touched blocks.
+        Returns False if the text was already identical.
+        """
+        old_text = self.plain_text()
+        if old_text == new_text:
+            return False
+
+        old_lines = old_text.splitlines(keepends=True)
+        new_lines = new_text.splitlines(keepends=True)
+        # Only diff the lines between the common head and tail; SequenceMatcher is far from linear.
+        head, limit = 0, min(len(old_lines), len(new_lines))
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        old_middle = old_lines[head:len(old_lines) - tail]
+        new_middle = new_lines[head:len(new_lines) - tail]
+
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        if len(old_middle) + len(new_middle) > self.DIFF_LINE_LIMIT:
+            # Too much changed to diff on the GUI thread; replace the changed region as one span.
+            start, end, replacement = compute_qt_text_delta(old_text, new_text)
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(replacement)
+        else:
+            # Qt positions count UTF-16 code units, so offsets are summed with utf16_len.
+            line_offsets = [utf16_len(''.join(old_lines[:head]))]
+            for line in old_middle:
+                line_offsets.append(line_offsets[-1] + utf16_len(line))
+
+            matcher = difflib.SequenceMatcher(None, old_middle, new_middle)
+            # Apply from the end so earlier offsets stay valid.
+            for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if tag == 'equal':
+                    continue
+                cursor.setPosition(line_offsets[i1])
+                cursor.setPosition(line_offsets[i2], QTextCursor.KeepAnchor)
+                cursor.insertText(''.join(new_middle[j1:j2]))
+        cursor.endEditBlock()
+        return True
 
     def _emit_cursor_position(self):
-        print("LOG: CodeEditor._emit_cursor_position - Entry")
+        log.debug("CodeEditor._emit_cursor_position - Entry")
         cursor = self.textCursor()
         line = cursor.blockNumber() + 1
         column = cursor.columnNumber() + 1
         self.cursor_position_changed_signal.emit(line, column)
-        print("LOG: CodeEditor._emit_cursor_position - Exit")
+        log.debug("CodeEditor._emit_cursor_position - Exit")
 
     def setup_completer(self):
-        print("LOG: CodeEditor.setup_completer - Entry")
+        log.debug("CodeEditor.setup_completer - Entry")
         self.completer = QCompleter(self)
         self.completer.setWidget(self)
         self.completer.setCompletionMode(QCompleter.PopupCompletion)
@@ -129,20 +312,20 @@ class CodeEditor(QPlainTextEdit):
         self.completer.activated.connect(self.insert_completion)
 
         self.cursorPositionChanged.connect(self.show_completion_if_dot)
-        print("LOG: CodeEditor.setup_completer - Exit")
+        log.debug("CodeEditor.setup_completer - Exit")
 
     def show_completion_if_dot(self):
-        print("LOG: CodeEditor.show_completion_if_dot - Entry")
+        log.debug("CodeEditor.show_completion_if_dot - Entry")
         cursor = self.textCursor()
         text_before_cursor = self.toPlainText()[:cursor.position()]
         if text_before_cursor and text_before_cursor[-1] == '.':
             self.request_completions()
         elif self.completer.popup().isVisible():
             self.completer.popup().hide()
-        print("LOG: CodeEditor.show_completion_if_dot - Exit")
+        log.debug("CodeEditor.show_completion_if_dot - Exit")
 
     def request_completions(self):
-        print("LOG: CodeEditor.request_completions - Entry")
+        log.debug("CodeEditor.request_completions - Entry")
         text = self.toPlainText()
         line = self.textCursor().blockNumber() + 1
         column = self.textCursor().columnNumber()
@@ -152,11 +335,11 @@ class CodeEditor(QPlainTextEdit):
         worker.signals.result.connect(self._handle_completions_result)
         worker.signals.error.connect(lambda msg: sys.stderr.write(f"Jedi error: {msg}\n"))
         self.thread_pool.start(worker)
-        print("LOG: CodeEditor.request_completions - Exit")
+        log.debug("CodeEditor.request_completions - Exit")
 
     @Slot(list)
     def _handle_completions_result(self, words):
-        print("LOG: CodeEditor._handle_completions_result - Entry")
+        log.debug("CodeEditor._handle_completions_result - Entry")
         self.completer.model().setStringList(words)
 
         if words:
@@ -170,12 +353,12 @@ class CodeEditor(QPlainTextEdit):
             self.completer.complete()
         else:
             self.completer.popup().hide()
-        print("LOG: CodeEditor._handle_completions_result - Exit")
+        log.debug("CodeEditor._handle_completions_result - Exit")
 
     def insert_completion(self, completion):
-        print("LOG: CodeEditor.insert_completion - Entry")
+        log.debug("CodeEditor.insert_completion - Entry")
         if self.completer.widget() is not self:
-            print("LOG: CodeEditor.insert_completion - Completer widget mismatch, returning.")
+            log.debug("CodeEditor.insert_completion - Completer widget mismatch, returning.")
             return
 
         tc = self.textCursor()
@@ -186,28 +369,28 @@ class CodeEditor(QPlainTextEdit):
         tc.insertText(completion)
         self.setTextCursor(tc)
         self._is_programmatic_change = False # Reset flag after programmatic change
-        print("LOG: CodeEditor.insert_completion - Exit")
+        log.debug("CodeEditor.insert_completion - Exit")
 
     def setup_linter(self):
-        print("LOG: CodeEditor.setup_linter - Entry")
+        log.debug("CodeEditor.setup_linter - Entry")
         self.linter_timer = QTimer(self)
         self.linter_timer.setInterval(700)
         self.linter_timer.setSingleShot(True)
         self.linter_timer.timeout.connect(self.lint_code)
-        print("LOG: CodeEditor.setup_linter - Exit")
+        log.debug("CodeEditor.setup_linter - Exit")
 
     def lint_code(self):
-        print("LOG: CodeEditor.lint_code - Entry")
+        log.debug("CodeEditor.lint_code - Entry")
         code = self.toPlainText()
         file_path = self.file_path if self.file_path else "untitled.py"
         worker = PyflakesLinterWorker(code)
         worker.signals.result.connect(self.apply_linting_highlights)
         worker.signals.error.connect(lambda msg: sys.stderr.write(f"Pyflakes error: {msg}\n"))
         self.thread_pool.start(worker)
-        print("LOG: CodeEditor.lint_code - Exit")
+        log.debug("CodeEditor.lint_code - Exit")
 
     def apply_linting_highlights(self, errors):
-        print("LOG: CodeEditor.apply_linting_highlights - Entry")
+        log.debug("CodeEditor.apply_linting_highlights - Entry")
         self._is_programmatic_change = True # Set flag before programmatic change
         extra_selections = []
         error_format = QTextCharFormat()
@@ -228,10 +411,11 @@ class CodeEditor(QPlainTextEdit):
 
         self.setExtraSelections(extra_selections)
         self._is_programmatic_change = False # Reset flag after programmatic change
-        print("LOG: CodeEditor.apply_linting_highlights - Exit")
+        log.debug("CodeEditor.apply_linting_highlights - Exit")
 
     def keyPressEvent(self, event: QKeyEvent):
-        print(f"LOG: CodeEditor.keyPressEvent - Key: {event.key()}, Text: '{event.text()}' - Entry")
+        if log.isEnabledFor(logging.DEBUG): # Skip the event.key()/text() calls on every keypress
+            log.debug("CodeEditor.keyPressEvent - Key: %s, Text: '%s' - Entry", event.key(), event.text())
         
         # Host-side logic to reclaim control
         if self.isReadOnly(): # The host is currently a viewer
@@ -278,7 +462,7 @@ class CodeEditor(QPlainTextEdit):
                 cursor.insertText("    ")
             self._is_programmatic_change = False
             event.accept() # Consume the event
-            print("LOG: CodeEditor.keyPressEvent - Tab handled, Exit")
+            log.debug("CodeEditor.keyPressEvent - Tab handled, Exit")
             return
 
         # 2. Handle "Smart Over-Typing" for Closing Brackets
@@ -289,7 +473,7 @@ class CodeEditor(QPlainTextEdit):
                 self.setTextCursor(cursor)
                 self._is_programmatic_change = False
                 event.accept() # Consume the event
-                print("LOG: CodeEditor.keyPressEvent - Over-typing handled, Exit")
+                log.debug("CodeEditor.keyPressEvent - Over-typing handled, Exit")
                 return
 
         # 3. Handle Context-Aware Insertion for Opening Brackets (Auto-pairing)
@@ -303,7 +487,7 @@ class CodeEditor(QPlainTextEdit):
                 self.setTextCursor(cursor)
                 self._is_programmatic_change = False
                 event.accept() # Consume the event
-                print("LOG: CodeEditor.keyPressEvent - Auto-pair wrap handled, Exit")
+                log.debug("CodeEditor.keyPressEvent - Auto-pair wrap handled, Exit")
                 return
             else:
                 # Context-aware insertion
@@ -322,7 +506,7 @@ class CodeEditor(QPlainTextEdit):
                     self.setTextCursor(cursor)
                     self._is_programmatic_change = False
                     event.accept() # Consume the event
-                    print("LOG: CodeEditor.keyPressEvent - Context-aware auto-pair insert handled, Exit")
+                    log.debug("CodeEditor.keyPressEvent - Context-aware auto-pair insert handled, Exit")
                     return
         
         # 4. Smart Backspace
@@ -336,9 +520,9 @@ class CodeEditor(QPlainTextEdit):
                 self.setTextCursor(cursor)
                 self._is_programmatic_change = False
                 event.accept() # Consume the event
-                print("LOG: CodeEditor.keyPressEvent - Smart Backspace handled, Exit")
+                log.debug("CodeEditor.keyPressEvent - Smart Backspace handled, Exit")
                 return
 
         # If none of the special cases are handled, call the default handler
         super().keyPressEvent(event)
-        print("LOG: CodeEditor.keyPressEvent - Default handler, Exit")
\ No newline at end of file
+        log.debug("CodeEditor.keyPressEvent - Default handler, Exit")
@@ -3,6 +3,7 @@ from PySide6.QtCore import QProcess, Signal, Slot, Qt
 from PySide6.QtGui import QTextCharFormat, QColor
 import sys
 import os
+from interactive_terminal import MAX_OUTPUT_BLOCKS
 
 class CommandOutputViewer(QWidget):
     def __init__(self, parent=None):
@@ -15,6 +16,8 @@ class CommandOutputViewer(QWidget):
         
         self.output_display = QPlainTextEdit(self)
         self.output_display.setReadOnly(True)
+        self.output_display.setMaximumBlockCount(MAX_OUTPUT_BLOCKS)
+        self.output_display.setLineWrapMode(QPlainTextEdit.NoWrap) # Long output lines aren't reflowed on resize/append
         self.output_display.setStyleSheet("background-color: black; color: white; font-family: 'Consolas', 'Monospace';")
         self.layout.addWidget(self.output_display)
 
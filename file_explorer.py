@@ -10,14 +10,21 @@ class FileExplorer(QTreeView):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.model = QFileSystemModel()
+        # Skip the per-directory icon provider lookups (extra stat() calls on every visible folder).
+        self.model.setOption(QFileSystemModel.Option.DontUseCustomDirectoryIcons, True)
         self.setModel(self.model)
+        self._pending_root_path = None # Root applied on first show; setRootPath starts a directory scan
 
-        # Hide unnecessary columns
+        # Hide unnecessary columns (Size, Type, Date Modified) in one pass on the header,
+        # without a header/layout update per column; the view lays itself out when first shown.
         self.setHeaderHidden(True)
-        self.hideColumn(1) # Size
-        self.hideColumn(2) # Type
-        self.hideColumn(3) # Date Modified
+        header = self.header()
+        header.blockSignals(True)
+        for column in range(1, self.model.columnCount()):
+            header.hideSection(column)
+        header.blockSignals(False)
 
+        self.setUniformRowHeights(True) # Every row is one icon + name; lets the view skip per-row size hints
         self.setAnimated(True)
         self.setIndentation(20)
         self.setSortingEnabled(True)
@@ -26,9 +33,25 @@ class FileExplorer(QTreeView):
         self.doubleClicked.connect(self.on_double_clicked)
 
     def set_root_path(self, path):
+        if not self.isVisible():
+            # Don't start the model's background scan for a tree nobody can see yet.
+            self._pending_root_path = path
+            return
+        self._pending_root_path = None
         self.model.setRootPath(path)
         self.setRootIndex(self.model.index(path))
 
+    def root_path(self):
+        """The requested root path, whether or not the model has been populated yet."""
+        if self._pending_root_path is not None:
+            return self._pending_root_path
+        return self.model.rootPath()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._pending_root_path is not None:
+            self.set_root_path(self._pending_root_path)
+
     @Slot(QModelIndex)
     def on_double_clicked(self, index):
         if not self.model.isDir(index):
@@ -52,7 +75,7 @@ class FileExplorer(QTreeView):
                 target_dir = self.model.filePath(index.parent())
         else:
             # If no item is clicked, use the current root path
-            target_dir = self.model.rootPath()
+            target_dir = self.root_path()
 
         file_name, ok = QInputDialog.getText(self, "New File", "Enter new file name:")
         if ok and file_name:
@@ -3,6 +3,8 @@ from PySide6.QtGui import QFont
 from PySide6.QtCore import Qt, Signal, Slot
 from PySide6.QtGui import QTextCursor
 
+MAX_OUTPUT_BLOCKS = 5000 # Output panels drop their oldest lines beyond this, keeping appends constant-time
+
 class InteractiveTerminal(QWidget):
     line_entered = Signal(str)
 
@@ -20,6 +22,7 @@ class InteractiveTerminal(QWidget):
         font = QFont("Cascadia Code", 10)
         self.output_view.setFont(font)
         self.output_view.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.output_view.setMaximumBlockCount(MAX_OUTPUT_BLOCKS)
         self.layout().addWidget(self.output_view)
 
         # Input Line
@@ -40,11 +43,14 @@ class InteractiveTerminal(QWidget):
 
     @Slot(str)
     def append_output(self, text: str):
+        # Suspend repaints so the insert and the scroll cost a single update.
+        self.output_view.setUpdatesEnabled(False)
         cursor = self.output_view.textCursor()
         cursor.movePosition(QTextCursor.End)
         self.output_view.setTextCursor(cursor)
         self.output_view.insertPlainText(text)
         self.output_view.verticalScrollBar().setValue(self.output_view.verticalScrollBar().maximum())
+        self.output_view.setUpdatesEnabled(True)
 
     @Slot()
     def clear_all(self):
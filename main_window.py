@@ -1,6 +1,6 @@
 from PySide6.QtWidgets import QMainWindow, QTabWidget, QStatusBar, QDockWidget, QApplication, QWidget, QVBoxLayout, QMenuBar, QMenu, QFileDialog, QLabel, QToolBar, QInputDialog, QMessageBox, QLineEdit, QPushButton, QToolButton, QComboBox, QPlainTextEdit
 from PySide6.QtGui import QAction, QIcon, QTextCharFormat, QColor, QTextCursor, QActionGroup, QFont
-from PySide6.QtCore import Qt, QProcess, Signal, Slot, QPoint, QModelIndex, QThreadPool, QStandardPaths, QObject
+from PySide6.QtCore import Qt, QProcess, Signal, Slot, QPoint, QModelIndex, QThreadPool, QStandardPaths, QObject, QSignalBlocker, QTimer, QSaveFile, QIODevice
 from file_explorer import FileExplorer
 from code_editor import CodeEditor
 from interactive_terminal import InteractiveTerminal # Import the new interactive terminal
@@ -8,13 +8,27 @@ from network_manager import NetworkManager # Import NetworkManager
 from connection_dialog import ConnectionDialog # Import ConnectionDialog
 from ai_assistant_window import AIAssistantWindow # Import the AI Assistant Window
 from ai_tools import AITools # Import AITools
+from worker_threads import BlackFormatterWorker, BLACK_MODE
+from text_delta import compute_qt_text_delta
 import tempfile
 import os
 import sys
 import shutil # For rmtree
 import json # Import json for structured messages
+import codecs
+import logging
 import black # Import black for synchronous formatting
 
+log = logging.getLogger(__name__)
+
+_ICONS = {} # Theme icon name -> QIcon; fromTheme() walks the icon search paths on every call
+
+def _icon(name):
+    icon = _ICONS.get(name)
+    if icon is None:
+        icon = _ICONS[name] = QIcon.fromTheme(name, QIcon())
+    return icon
+
 class MainWindow(QMainWindow):
     # Signals for AI Tools to get results back from MainWindow
     ai_get_current_code_result = Signal(str)
@@ -35,6 +49,15 @@ class MainWindow(QMainWindow):
 
 
         self.is_updating_from_network = False # Flag to prevent echo loop
+        self._has_peers = False # Cached peer state, kept in sync by NetworkManager.peer_count_changed
+
+        # Outgoing edits are coalesced and sent as TEXT_DIFF deltas against the last text the peer has.
+        self._network_flush_timer = QTimer(self)
+        self._network_flush_timer.setSingleShot(True)
+        self._network_flush_timer.setInterval(self.NETWORK_FLUSH_INTERVAL_MS)
+        self._network_flush_timer.timeout.connect(self._flush_network_edits)
+        self._last_sent_editor = None # Editor whose change baseline matches the peer; None forces a full snapshot
+        self._sends_since_snapshot = 0
 
         self.network_manager = NetworkManager(self) # Initialize NetworkManager
         self.ai_tools = AITools(self) # Initialize AITools
@@ -48,9 +71,22 @@ class MainWindow(QMainWindow):
         # State variables for collaborative editing
         self.is_host = False
         self.has_control = False # True if this instance has the editing token
+        self._control_request_box = None # Open Grant Control prompt, if any
+        self._last_ui_state = None # Inputs update_ui_for_control_state last applied
+        self._ui_refresh_pending = False # A coalesced update_ui_for_control_state is queued
         self.tab_data_map = {} # Map to store tab-specific data (e.g., file paths)
+        self._open_paths = {} # file_path -> CodeEditor, kept in sync by _set_editor_file_path/close_tab
+        self._dirty_editors = set() # Editors whose tab_data["is_dirty"] is set, so closeEvent needn't scan every tab
+        self._pending_formats = {} # file_path -> (editor, source text) for in-flight Black runs
 
         self.current_run_mode = "Run" # Initial run mode
+        self._compile_runner_config()
+        self.process = None
+        self._pending_run_stages = [] # Remaining '&&' stages of the current Run, started as each one succeeds
+        self._process_output_buffer = bytearray() # Raw stdout bytes waiting for the next flush
+        self._process_output_decoder = None
+        self._process_output_flush_pending = False
+        self._reset_process_output()
         self.setup_status_bar() # Initialize status bar labels first
         self.setup_toolbar() # Re-enable toolbar for the new button
         self.setup_ui()
@@ -167,8 +203,15 @@ class MainWindow(QMainWindow):
         format_code_action.triggered.connect(self.format_current_code)
         edit_menu.addAction(format_code_action)
 
-        # View Menu (Placeholder for now)
+        # View Menu
         view_menu = menu_bar.addMenu("&View")
+        self.syntax_highlighting_action = QAction("Enable &Syntax Highlighting", self)
+        self.syntax_highlighting_action.setCheckable(True)
+        self.syntax_highlighting_action.setShortcut("Ctrl+Shift+H")
+        self.syntax_highlighting_action.setChecked(True)
+        self.syntax_highlighting_action.triggered.connect(self._toggle_syntax_highlighting)
+        view_menu.addAction(self.syntax_highlighting_action)
+        self._sync_syntax_highlighting_action()
 
         # Run Menu
         run_menu = menu_bar.addMenu("&Run")
@@ -208,7 +251,7 @@ class MainWindow(QMainWindow):
         toolbar.addWidget(self.language_selector)
 
         # Play Button (QAction)
-        self.run_debug_action_button = QAction(QIcon.fromTheme("media-playback-start"), "Run Code", self) # Tooltip updated
+        self.run_debug_action_button = QAction(_icon("media-playback-start"), "Run Code", self) # Tooltip updated
         self.run_debug_action_button.setToolTip("Run Code (F5)")
         self.run_debug_action_button.setShortcut("F5")
         self.run_debug_action_button.triggered.connect(self._handle_run_request) # Connect to new handler
@@ -222,7 +265,7 @@ class MainWindow(QMainWindow):
 
         # AI Assistant Button
         self.ai_assistant_button = QPushButton("AI Assistant", self)
-        self.ai_assistant_button.setIcon(QIcon.fromTheme("accessories-text-editor")) # Placeholder icon
+        self.ai_assistant_button.setIcon(_icon("accessories-text-editor")) # Placeholder icon
         self.ai_assistant_button.clicked.connect(self.open_ai_assistant)
         toolbar.addWidget(self.ai_assistant_button)
 
@@ -256,11 +299,9 @@ class MainWindow(QMainWindow):
         self.network_manager.status_changed.connect(self.status_bar.showMessage)
         self.network_manager.peer_connected.connect(self.on_peer_connected)
         self.network_manager.peer_disconnected.connect(self.on_peer_disconnected)
-        
-        # New signals for control management
-        self.network_manager.control_request_received.connect(self.on_control_request_received)
-        self.network_manager.control_granted.connect(self.on_control_granted)
-        self.network_manager.control_revoked.connect(self.on_control_revoked)
+        self.network_manager.peer_count_changed.connect(self._on_peer_count_changed)
+        self.network_manager.diff_received.connect(self.on_network_diff_received)
+        self.network_manager.sync_requested.connect(self._on_sync_requested)
         
         # New signals for control management
         self.network_manager.control_request_received.connect(self.on_control_request_received)
@@ -268,6 +309,9 @@ class MainWindow(QMainWindow):
         self.network_manager.control_declined.connect(self.on_control_declined) # Connect new signal
         self.network_manager.control_revoked.connect(self.on_control_revoked)
 
+    NETWORK_FLUSH_INTERVAL_MS = 50 # Keystrokes within this window go out as one message
+    NETWORK_SNAPSHOT_INTERVAL = 20 # Every Nth send is a full TEXT_UPDATE, as a resync checkpoint
+
     EXTENSION_TO_LANGUAGE = {
         ".py": "Python",
         ".js": "JavaScript",
@@ -285,7 +329,44 @@ class MainWindow(QMainWindow):
         "JavaScript": ["node", "{file}"]
     }
 
+    def _compile_runner_config(self):
+        """Splits each RUNNER_CONFIG command once into '&&' stages of literal parts and format_map templates."""
+        self._compiled_run_commands = {}
+        for language, command in self.RUNNER_CONFIG.items():
+            stages = [[]]
+            for part in command:
+                if part == "&&": # QProcess runs no shell, so '&&' is sequenced by _on_process_finished
+                    stages.append([])
+                else:
+                    stages[-1].append(part.format_map if "{" in part else part)
+            self._compiled_run_commands[language] = stages
+
+    HEADER_EXTENSIONS = (".h", ".hh", ".hpp", ".hxx", ".inl")
+
+    @staticmethod
+    def _build_is_current(source_path, output_path):
+        """
+        True if the build output (output_path, or its .exe on Windows) is at least as new as
+        source_path and every header next to it, so edits to a local #include "..." rebuild too.
+        """
+        try:
+            newest_input = os.path.getmtime(source_path)
+            with os.scandir(os.path.dirname(source_path) or ".") as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith(MainWindow.HEADER_EXTENSIONS) and entry.is_file():
+                        newest_input = max(newest_input, entry.stat().st_mtime)
+        except OSError:
+            return False
+        candidates = [output_path + ".exe", output_path] if sys.platform == "win32" else [output_path]
+        for candidate in candidates:
+            try:
+                return os.path.getmtime(candidate) >= newest_input
+            except OSError:
+                continue
+        return False
+
     def _update_status_bar_and_language_selector_on_tab_change(self, index):
+        self._sync_syntax_highlighting_action()
         editor = self.tab_widget.widget(index)
         if isinstance(editor, CodeEditor):
             # Update status bar labels
@@ -326,9 +407,14 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def on_text_editor_changed(self):
-        current_editor = self._get_current_code_editor()
+        # Every editor stays connected for its lifetime; act on the one that emitted.
+        current_editor = self.sender()
+        if not isinstance(current_editor, CodeEditor):
+            current_editor = self._get_current_code_editor()
         if not current_editor:
             return
+        if current_editor in self._dirty_editors:
+            return # Already marked; every further keystroke would just re-resolve the same tab
 
         current_index = self.tab_widget.indexOf(current_editor) # Keep for tab title update
         if current_index == -1:
@@ -347,38 +433,133 @@ class MainWindow(QMainWindow):
         if not self.is_updating_from_network:
             if not tab_data.get("is_dirty", False):
                 tab_data["is_dirty"] = True # Update the dict in the map by reference
+                self._dirty_editors.add(current_editor)
                 # No self.tab_widget.setTabData call needed here.
                 # Add asterisk to tab title
-                current_tab_text = self.tab_widget.tabText(current_index)
-                if not current_tab_text.endswith("*"):
-                    self.tab_widget.setTabText(current_index, current_tab_text + "*")
-            
-            # If in a collaborative session and we have control, send text updates
-            if self.network_manager.is_connected() and self.has_control and not current_editor.isReadOnly():
-                text = current_editor.toPlainText()
-                self.network_manager.send_data('TEXT_UPDATE', text)
+                self.tab_widget.setTabText(current_index, current_editor._base_name + "*")
+
+    @Slot()
+    def _on_editor_text_changed_for_network(self):
+        # Single-user editing is the common case: bail out before touching any Qt object.
+        if not self._has_peers:
+            return
+        if self.is_updating_from_network:
+            return
+
+        current_editor = self._get_current_code_editor()
+        if not current_editor or self.sender() is not current_editor:
+            return # Only the active tab is shared with peers
+
+        # Coalesce bursts of keystrokes; the flush reads the document once. Don't restart a running
+        # timer: continuous typing would otherwise postpone the send until the user pauses.
+        if not self._network_flush_timer.isActive():
+            self._network_flush_timer.start()
+
+    @Slot()
+    def _flush_network_edits(self):
+        current_editor = self._get_current_code_editor()
+        if not current_editor:
+            return
+
+        # If in a collaborative session and we have control, send text updates
+        if self.network_manager.is_connected() and self.has_control and not current_editor.isReadOnly():
+            if (self._last_sent_editor is not current_editor
+                    or self._sends_since_snapshot >= self.NETWORK_SNAPSHOT_INTERVAL):
+                self.network_manager.send_data('TEXT_UPDATE', current_editor.plain_text())
+                self._sends_since_snapshot = 0
+            else:
+                # The editor tracked the edited span from contentsChange, so no full-text comparison is needed.
+                span = current_editor.changed_span()
+                if span is not None:
+                    start, end, replacement, base_length = span
+                    self.network_manager.send_data('TEXT_DIFF', {
+                        'start': start,
+                        'end': end,
+                        'text': replacement,
+                        'base_length': base_length,
+                    })
+                    self._sends_since_snapshot += 1
+            self._reset_network_baseline(current_editor, keep_snapshot_count=True)
+
+    def _flush_pending_network_edits(self):
+        """Sends edits still waiting on the flush timer now; used right before control changes hands."""
+        if self._network_flush_timer.isActive():
+            self._network_flush_timer.stop()
+            self._flush_network_edits()
+
+    def _reset_network_baseline(self, editor=None, keep_snapshot_count=False):
+        """Records that the peer holds editor's current text; with no editor, the next send is a snapshot."""
+        self._last_sent_editor = editor
+        if editor is not None:
+            editor.mark_change_baseline()
+        if not keep_snapshot_count:
+            self._sends_since_snapshot = 0
+
+    @Slot(int)
+    def _on_peer_count_changed(self, count):
+        self._has_peers = count > 0
+        self._network_flush_timer.stop()
+        self._reset_network_baseline()
+
+    @Slot()
+    def _on_sync_requested(self):
+        self._reset_network_baseline()
+        self._flush_network_edits()
 
     @Slot(str)
     def on_network_data_received(self, data):
-        print(f"8. Editor update slot called. Received data parameter: {data[:50]}...")
         current_editor = self._get_current_code_editor() # Use helper
         if current_editor:
             try:
                 # The data parameter is already the content string, not the full JSON message.
                 # No need to json.loads() here.
                 content = data
-                print(f"LOG: MainWindow.on_network_data_received - Parsed message in MainWindow: (content directly used)")
-                self.is_updating_from_network = True
-                current_cursor_pos = current_editor.textCursor().position()
-                print(f"LOG: MainWindow.on_network_data_received - Setting text: {content[:50]}...")
-                current_editor.setPlainText(content)
-                cursor = current_editor.textCursor()
-                cursor.setPosition(current_cursor_pos)
-                current_editor.setTextCursor(cursor)
-                self.is_updating_from_network = False
+                current_text = current_editor.plain_text()
+                if content == current_text:
+                    # Periodic snapshots usually match what the diffs already built; skip all cursor and layout work.
+                    self._reset_network_baseline(current_editor)
+                    return
+                # Replace only the span that differs: setPlainText would rebuild the whole document,
+                # re-highlight every block and reset the user's cursor and scroll position.
+                start, end, replacement = compute_qt_text_delta(current_text, content)
+                self._apply_remote_edit(current_editor, start, end, replacement)
+                # Both sides now hold exactly this text; later local edits can be sent as diffs against it.
+                self._reset_network_baseline(current_editor)
             except Exception as e:
-                print(f"LOG: MainWindow.on_network_data_received - Error processing received data: {e}")
-        print("LOG: MainWindow.on_network_data_received - Exit")
+                log.warning("on_network_data_received - Error processing received data: %s", e)
+
+    @Slot(int, int, str, int)
+    def on_network_diff_received(self, start, end, text, base_length):
+        current_editor = self._get_current_code_editor()
+        if not current_editor:
+            return
+        document = current_editor.document()
+        if document.characterCount() - 1 != base_length:
+            # Our copy diverged from the sender's; ask for a full snapshot instead of corrupting it.
+            self.network_manager.send_data('REQ_SYNC')
+            return
+
+        self._apply_remote_edit(current_editor, start, end, text)
+        self._reset_network_baseline() # Our outgoing baseline is unknown until the next snapshot
+
+    def _apply_remote_edit(self, editor, start, end, text):
+        """Replaces the UTF-16 span [start, end) of editor's document with text received from the peer."""
+        document = editor.document()
+        # Block the editor's own signals (not the document's, which the highlighter and the
+        # plain-text/change-span tracking listen to) so textChanged is never emitted for a remote apply.
+        blocker = QSignalBlocker(editor)
+        # Remote edits stay out of the undo stack: a watching peer would otherwise accumulate one
+        # entry per received edit for the whole session. Disabling undo also clears the stack.
+        document.setUndoRedoEnabled(False)
+        try:
+            cursor = QTextCursor(document) # Standalone: the user's cursor and scroll position just shift
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+        finally:
+            document.setUndoRedoEnabled(True)
+            blocker.unblock()
+        editor.linter_timer.start() # textChanged was suppressed, so re-lint explicitly
 
     @Slot()
     def on_peer_connected(self):
@@ -387,8 +568,8 @@ class MainWindow(QMainWindow):
         self.start_host_action.setEnabled(False)
         self.connect_host_action.setEnabled(False)
         self.stop_session_action.setEnabled(True)
-        self.update_ui_for_control_state() # Update UI after connection
-        print(f"LOG: on_peer_connected - is_host={self.is_host}, has_control={self.has_control}")
+        self._request_ui_refresh() # Update UI after connection
+        log.debug("on_peer_connected - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def on_peer_disconnected(self):
@@ -399,8 +580,8 @@ class MainWindow(QMainWindow):
         self.stop_session_action.setEnabled(False)
         self.is_host = False
         self.has_control = False
-        self.update_ui_for_control_state() # Reset UI after disconnection
-        print(f"LOG: on_peer_disconnected - is_host={self.is_host}, has_control={self.has_control}")
+        self._request_ui_refresh() # Reset UI after disconnection
+        log.debug("on_peer_disconnected - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def start_hosting_session(self):
@@ -413,8 +594,8 @@ class MainWindow(QMainWindow):
                 self.stop_session_action.setEnabled(True)
                 self.is_host = True
                 self.has_control = True # Host starts with control
-                self.update_ui_for_control_state()
-                print(f"LOG: start_hosting_session - is_host={self.is_host}, has_control={self.has_control}")
+                self._request_ui_refresh()
+                log.debug("start_hosting_session - is_host=%s, has_control=%s", self.is_host, self.has_control)
             else:
                 QMessageBox.critical(self, "Error", "Failed to start hosting session.")
 
@@ -435,8 +616,8 @@ class MainWindow(QMainWindow):
             self.stop_session_action.setEnabled(True)
             self.is_host = False
             self.has_control = False # Client starts without control
-            self.update_ui_for_control_state()
-            print(f"LOG: connect_to_host_session - is_host={self.is_host}, has_control={self.has_control}")
+            self._request_ui_refresh()
+            log.debug("connect_to_host_session - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def stop_current_session(self):
@@ -447,8 +628,8 @@ class MainWindow(QMainWindow):
         self.stop_session_action.setEnabled(False)
         self.is_host = False
         self.has_control = False
-        self.update_ui_for_control_state() # Reset UI after session stop
-        print(f"LOG: stop_current_session - is_host={self.is_host}, has_control={self.has_control}")
+        self._request_ui_refresh() # Reset UI after session stop
+        log.debug("stop_current_session - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot(int, int)
     def _update_cursor_position_label(self, line, column):
@@ -458,6 +639,32 @@ class MainWindow(QMainWindow):
     def _update_language_label(self, language):
         self.language_label.setText(f"Language: {language}")
 
+    @Slot(bool)
+    def _toggle_syntax_highlighting(self, enabled):
+        editor = self._get_current_code_editor()
+        if editor:
+            editor.set_highlighting_enabled(enabled)
+
+    def _sync_syntax_highlighting_action(self):
+        """Reflects the current editor's highlighting state in the View menu."""
+        if not hasattr(self, 'syntax_highlighting_action'): # Menus are built after the first tab opens
+            return
+        editor = self._get_current_code_editor()
+        self.syntax_highlighting_action.setEnabled(editor is not None)
+        self.syntax_highlighting_action.setChecked(editor.highlighting_enabled if editor else False)
+
+    def _set_editor_file_path(self, editor, file_path, tab_data=None):
+        """Single place that changes an editor's path; caches the tab title so hot paths skip basename()."""
+        if editor.file_path and self._open_paths.get(editor.file_path) is editor:
+            del self._open_paths[editor.file_path]
+        if file_path:
+            self._open_paths[file_path] = editor
+        editor.file_path = file_path
+        editor._base_name = os.path.basename(file_path) if file_path else "Untitled"
+        if tab_data is not None:
+            tab_data["path"] = file_path
+        editor._update_language_and_highlighting() # Lexer only changes with the path
+
     def _get_current_code_editor(self):
         """Helper to get the current CodeEditor widget, or None if not a CodeEditor."""
         current_widget = self.tab_widget.currentWidget()
@@ -473,9 +680,11 @@ class MainWindow(QMainWindow):
             self.statusBar().showMessage("No active editor to run.", 3000)
             return
 
-        if not self.save_current_file(): # save_current_file calls _save_file
-            self.statusBar().showMessage("Save operation cancelled or failed. Run aborted.", 3000)
-            return
+        # Only save when needed: rewriting an unchanged file would re-run Black and make the build look stale.
+        if self.tab_data_map.get(editor, {}).get("is_dirty", False) or not editor.file_path:
+            if not self.save_current_file(): # save_current_file calls _save_file
+                self.statusBar().showMessage("Save operation cancelled or failed. Run aborted.", 3000)
+                return
 
         file_path = editor.file_path
         if not file_path:
@@ -489,7 +698,7 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Execution Error", f"No language is configured for file type '{extension}'.")
             return
 
-        command_template = self.RUNNER_CONFIG.get(language_name) # This is now a list
+        command_template = self._compiled_run_commands.get(language_name) # Precompiled in __init__
         if not command_template:
             QMessageBox.warning(self, "Execution Error", f"No 'run' command is configured for the language '{language_name}'.")
             return
@@ -498,10 +707,13 @@ class MainWindow(QMainWindow):
         self.terminal_widget.clear_all()
         self.statusBar().showMessage(f"Executing '{os.path.basename(file_path)}'...")
         
-        output_file_no_ext = os.path.splitext(file_path)[0]
-
-        executable = command_template[0]
-        arguments = [part.replace("{file}", file_path).replace("{output_file}", output_file_no_ext) for part in command_template[1:]]
+        context = {"file": file_path, "output_file": os.path.splitext(file_path)[0]}
+        stages = [[part(context) if callable(part) else part for part in stage] for stage in command_template]
+        if len(stages) > 1 and self._build_is_current(file_path, context["output_file"]):
+            stages = stages[-1:] # Source and headers unchanged since the last build: run the existing binary
+            self.terminal_widget.append_output(
+                f"--- Build is up to date; running existing {os.path.basename(context['output_file'])} ---\n")
+        executable, *arguments = stages[0]
 
         working_directory = os.path.dirname(file_path)
 
@@ -509,22 +721,24 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'process') and self.process is not None:
             self.process.kill() # Ensure any old process is gone
         self.process = QProcess(self)
+        self._pending_run_stages = stages[1:]
+        self._reset_process_output()
+        # stderr goes through the same batched reader, interleaved in the order the process wrote it.
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
         
         # Connect ALL signals for maximum debugging visibility.
         self.process.readyReadStandardOutput.connect(self._on_process_output)
-        self.process.readyReadStandardError.connect(self._on_process_error_output)
         self.process.errorOccurred.connect(self._on_process_error)
         self.process.finished.connect(self._on_process_finished)
-        self.process.started.connect(lambda: print("DEBUG: Signal 'started' was emitted for _handle_run_request."))
 
         self.process.setWorkingDirectory(working_directory)
         
         # Start the process.
-        print(f"DEBUG: Calling QProcess.start() for run request: {executable} {arguments}")
+        log.debug("_handle_run_request - starting %s %s", executable, arguments)
         self.process.start(executable, arguments)
         
         if not self.process.waitForStarted(3000): # Wait up to 3 seconds
-            print("DEBUG: process.waitForStarted() timed out. The process likely failed to launch.")
+            log.warning("_handle_run_request - process did not start within 3 s: %s", executable)
             self.terminal_widget.append_output("--- PROCESS FAILED TO START (Timeout) ---\n")
 
         self.bottom_tab_widget.setCurrentWidget(self.terminal_widget) # Switch to interactive terminal
@@ -552,10 +766,12 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'process') and self.process is not None:
             self.process.kill() # Ensure any old process is gone
         self.process = QProcess(self)
+        self._pending_run_stages = []
+        self._reset_process_output()
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
         
         # 4. Connect ALL signals for maximum debugging visibility.
         self.process.readyReadStandardOutput.connect(self._on_process_output)
-        self.process.readyReadStandardError.connect(self._on_process_error_output)
         self.process.errorOccurred.connect(self._on_process_error)
         self.process.finished.connect(self._on_process_finished)
         self.process.started.connect(lambda: print("DEBUG: Signal 'started' was emitted for diagnostic test."))
@@ -580,19 +796,38 @@ class MainWindow(QMainWindow):
         else:
             self.terminal_widget.append_output("Error: No process is running to receive input.\n")
 
-    @Slot()
-    def _on_process_output(self):
-        data = self.process.readAllStandardOutput().data().decode(sys.getfilesystemencoding(), errors='ignore')
-        self.terminal_widget.append_output(data)
+    def _reset_process_output(self):
+        """Starts a fresh stdout buffer and decoder for a newly created process."""
+        self._process_output_buffer.clear()
+        self._process_output_decoder = codecs.getincrementaldecoder(sys.getfilesystemencoding())(errors='replace')
 
     @Slot()
-    def _on_process_error_output(self):
-        error_output = self.process.readAllStandardError().data().decode(errors='ignore')
-        print(f"DEBUG: _on_process_error_output received:\n{error_output}")
-        self.terminal_widget.append_output(f"STDERR: {error_output}")
+    def _on_process_output(self):
+        # Chatty processes emit many small chunks; coalesce them into one append per frame.
+        self._process_output_buffer += self.process.readAllStandardOutput().data()
+        if not self._process_output_flush_pending:
+            self._process_output_flush_pending = True
+            QTimer.singleShot(16, self._flush_process_output)
+
+    def _flush_process_output(self, final=False):
+        self._process_output_flush_pending = False
+        # The incremental decoder keeps multi-byte sequences split across reads intact.
+        data = self._process_output_decoder.decode(bytes(self._process_output_buffer), final=final)
+        self._process_output_buffer.clear()
+        if data:
+            self.terminal_widget.append_output(data)
 
     @Slot(int, QProcess.ExitStatus)
     def _on_process_finished(self, exit_code, exit_status):
+        if self.sender() is not self.process:
+            return # A process replaced by a newer Run; its output and stages no longer apply
+        self._flush_process_output(final=True)
+        if exit_status == QProcess.NormalExit and exit_code == 0 and self._pending_run_stages:
+            executable, *arguments = self._pending_run_stages.pop(0) # e.g. run the binary g++ just built
+            self._reset_process_output()
+            self.process.start(executable, arguments)
+            return
+        self._pending_run_stages = []
         status = "crashed" if exit_status == QProcess.CrashExit else "finished"
         print(f"DEBUG: Signal 'finished' was emitted. Code: {exit_code}, Status: {status}")
         self.terminal_widget.append_output(f"\n--- Process {status} with exit code {exit_code} ---\n")
@@ -613,9 +848,29 @@ class MainWindow(QMainWindow):
                 # If not in a session, editor is always writable
                 current_editor.setReadOnly(False)
 
+    def _request_ui_refresh(self):
+        """Applies the editor's read-only state now and queues one control UI refresh for this event loop pass."""
+        self.update_editor_read_only_state() # Immediate, so a viewer never gets a window to type in
+        if self._ui_refresh_pending:
+            return # Several control messages in one read share the refresh
+        self._ui_refresh_pending = True
+        QTimer.singleShot(0, self._flush_ui_refresh)
+
+    @Slot()
+    def _flush_ui_refresh(self):
+        self._ui_refresh_pending = False
+        self.update_ui_for_control_state()
+
     def update_ui_for_control_state(self):
+        connected = self.network_manager.is_connected()
+        current_editor = self._get_current_code_editor()
+        state = (connected, self.is_host, self.has_control, current_editor)
+        if state == self._last_ui_state:
+            return # Echoed control messages and repeated calls would only re-apply the same widget state
+        self._last_ui_state = state
+
         # Update status bar message
-        if self.network_manager.is_connected():
+        if connected:
             if self.is_host:
                 if self.has_control:
                     self.control_status_label.setText("You have editing control.")
@@ -630,14 +885,15 @@ class MainWindow(QMainWindow):
             self.control_status_label.setText("Not in session")
 
         # Update "Request Control" button state
-        if self.network_manager.is_connected() and not self.is_host:
+        if connected and not self.is_host:
             self.request_control_button.setEnabled(not self.has_control)
         else:
             self.request_control_button.setEnabled(False) # Only client can request control
 
         # Update editor read-only state
         self.update_editor_read_only_state()
-        print(f"LOG: update_ui_for_control_state - is_host={self.is_host}, has_control={self.has_control}, editor_read_only={self._get_current_code_editor().isReadOnly() if self._get_current_code_editor() else 'N/A'}")
+        log.debug("update_ui_for_control_state - is_host=%s, has_control=%s, editor_read_only=%s",
+                  self.is_host, self.has_control, current_editor.isReadOnly() if current_editor else 'N/A')
 
     @Slot()
     def request_control(self):
@@ -645,30 +901,48 @@ class MainWindow(QMainWindow):
             self.network_manager.send_data('REQ_CONTROL')
             self.status_bar.showMessage("Requesting control...")
             self.request_control_button.setEnabled(False) # Disable button after request
-            print(f"LOG: request_control - is_host={self.is_host}, has_control={self.has_control}")
+            log.debug("request_control - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def on_control_request_received(self):
         if self.is_host and self.has_control: # Host has control and client requests it
-            reply = QMessageBox.question(self, "Control Request",
-                                         "The client has requested editing control. Grant control?",
-                                         QMessageBox.Yes | QMessageBox.No)
-            if reply == QMessageBox.Yes:
-                self.network_manager.send_data('GRANT_CONTROL')
-                self.has_control = False
-                self.update_ui_for_control_state()
-                self.status_bar.showMessage("Control granted to client.")
-            else:
-                self.network_manager.send_data('DECLINE_CONTROL')
-                self.status_bar.showMessage("Control request declined.")
+            if self._control_request_box is not None:
+                return # Already asking; repeated requests share one prompt
+            # Non-modal and shown without focus: the host keeps typing (and the network keeps flowing)
+            # until they answer, and a stray Enter can't pick the default button.
+            box = QMessageBox(QMessageBox.Question, "Control Request",
+                              "The client has requested editing control. Grant control?",
+                              QMessageBox.Yes | QMessageBox.No, self)
+            box.setDefaultButton(QMessageBox.No)
+            box.setAttribute(Qt.WA_DeleteOnClose)
+            box.setAttribute(Qt.WA_ShowWithoutActivating)
+            box.setWindowModality(Qt.NonModal)
+            box.finished.connect(self._on_control_request_answered)
+            self._control_request_box = box
+            box.show()
+
+    @Slot(int)
+    def _on_control_request_answered(self, result):
+        self._control_request_box = None
+        if not (self.is_host and self.has_control and self.network_manager.is_connected()):
+            return # The session or control changed while the prompt was open
+        if QMessageBox.StandardButton(result) == QMessageBox.Yes: # finished() delivers a plain int
+            self._flush_pending_network_edits() # The client must start from our latest text
+            self.network_manager.send_data('GRANT_CONTROL')
+            self.has_control = False
+            self._request_ui_refresh()
+            self.status_bar.showMessage("Control granted to client.")
+        else:
+            self.network_manager.send_data('DECLINE_CONTROL')
+            self.status_bar.showMessage("Control request declined.")
 
     @Slot()
     def on_control_granted(self):
         if not self.is_host: # Only client receives this
             self.has_control = True
-            self.update_ui_for_control_state()
+            self._request_ui_refresh()
             self.status_bar.showMessage("You have been granted editing control.")
-            print(f"LOG: on_control_granted - is_host={self.is_host}, has_control={self.has_control}")
+            log.debug("on_control_granted - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def on_control_declined(self):
@@ -679,19 +953,20 @@ class MainWindow(QMainWindow):
     @Slot()
     def on_control_revoked(self):
         if not self.is_host: # Only client receives this
+            self._flush_pending_network_edits() # Hand over our last keystrokes before losing control
             self.has_control = False
-            self.update_ui_for_control_state()
+            self._request_ui_refresh()
             self.status_bar.showMessage("Editing control has been revoked.")
-            print(f"LOG: on_control_revoked - is_host={self.is_host}, has_control={self.has_control}")
+            log.debug("on_control_revoked - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def on_host_reclaim_control(self):
         if self.is_host and not self.has_control: # Host reclaims control
             self.has_control = True
-            self.update_ui_for_control_state()
+            self._request_ui_refresh()
             self.network_manager.send_data('REVOKE_CONTROL')
             self.status_bar.showMessage("You have reclaimed editing control.")
-            print(f"LOG: on_host_reclaim_control - is_host={self.is_host}, has_control={self.has_control}")
+            log.debug("on_host_reclaim_control - is_host=%s, has_control=%s", self.is_host, self.has_control)
 
     @Slot()
     def _ai_handle_get_current_code_request(self):
@@ -706,18 +981,22 @@ class MainWindow(QMainWindow):
             print("LOG: _ai_handle_get_current_code_request - No active editor, emitted empty string.")
 
     def open_new_tab(self, file_path=None):
+        open_editor = self._open_paths.get(file_path) if file_path else None
+        if open_editor is not None: # Already open; just focus it
+            self.tab_widget.setCurrentWidget(open_editor)
+            return
+
         editor = CodeEditor(self)
         tab_title = "Untitled"
         tab_data = {"path": None, "is_dirty": False} # Initialize tab state
 
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                editor.setPlainText(content)
-                tab_title = os.path.basename(file_path) # Get filename
-                editor.file_path = file_path # Store file path in editor widget
-                tab_data["path"] = file_path # Set path for existing file
+                editor.load_file(file_path)
+                self._set_editor_file_path(editor, file_path, tab_data)
+                tab_title = editor._base_name
+                if not editor.highlighting_enabled: # load_file turned it off for a large file
+                    self.status_bar.showMessage(f"Syntax highlighting disabled for large file '{tab_title}'; press Ctrl+Shift+H to enable.", 5000)
             except FileNotFoundError:
                 QMessageBox.critical(self, "Error", f"File not found: '{file_path}'")
                 editor.deleteLater() # Clean up the editor if file not found
@@ -735,7 +1014,7 @@ class MainWindow(QMainWindow):
                 editor.deleteLater()
                 return
         else:
-            editor.file_path = None # For new untitled files
+            self._set_editor_file_path(editor, None, tab_data) # For new untitled files
 
         index = self.tab_widget.addTab(editor, tab_title)
         # self.tab_data_map[editor] = tab_data # Store tab state - MOVED, ALREADY PRESENT
@@ -746,7 +1025,8 @@ class MainWindow(QMainWindow):
         # Connect signals from the new editor to update status bar
         editor.cursor_position_changed_signal.connect(self._update_cursor_position_label)
         editor.language_changed_signal.connect(self._update_language_label)
-        editor.textChanged.connect(self.on_text_editor_changed) # Connect for network sync
+        editor.textChanged.connect(self.on_text_editor_changed) # Dirty tracking
+        editor.textChanged.connect(self._on_editor_text_changed_for_network) # Connect for network sync
         editor.control_reclaim_requested.connect(self.on_host_reclaim_control) # Connect new signal
         self._update_status_bar_and_language_selector_on_tab_change(index) # Update status bar immediately for new tab
         self.update_editor_read_only_state() # Apply initial read-only state
@@ -820,20 +1100,17 @@ class MainWindow(QMainWindow):
 
         widget = self.tab_widget.widget(index_to_close)
         if widget is not None:
-            # Disconnect signals first
-            if isinstance(widget, CodeEditor):
-                try:
-                    widget.textChanged.disconnect(self.on_text_editor_changed)
-                    widget.control_reclaim_requested.disconnect(self.on_host_reclaim_control)
-                    # Attempt to disconnect other signals if they were connected
-                    widget.cursor_position_changed_signal.disconnect(self._update_cursor_position_label)
-                    widget.language_changed_signal.disconnect(self._update_language_label)
-                except RuntimeError: # Signal already disconnected
-                    pass 
+            # Silence the editor until deleteLater() destroys it, which drops all of its connections.
+            # Editors are connected exactly once, so there is nothing to disconnect one by one.
+            widget.blockSignals(True)
             
             # Remove from tab_data_map
             if widget in self.tab_data_map:
                 del self.tab_data_map[widget]
+            self._dirty_editors.discard(widget)
+            file_path = getattr(widget, "file_path", None)
+            if file_path and self._open_paths.get(file_path) is widget:
+                del self._open_paths[file_path]
             
             widget.deleteLater()
         
@@ -852,7 +1129,7 @@ class MainWindow(QMainWindow):
             else: # A file is selected
                 target_directory = os.path.dirname(selected_path)
         else: # Nothing is selected, default to root path
-            target_directory = self.file_explorer.model.rootPath()
+            target_directory = self.file_explorer.root_path()
 
         if not target_directory:
             QMessageBox.critical(self, "Error", "Could not determine target directory for new file.")
@@ -930,7 +1207,7 @@ class MainWindow(QMainWindow):
         # Fallback logic for current_path if tab_data had None, but editor knew its path (and not save_as)
         if current_path is None and editor.file_path is not None and not save_as:
              current_path = editor.file_path
-             tab_data["path"] = current_path # Synchronize tab_data into our map's dictionary
+             self._set_editor_file_path(editor, current_path, tab_data) # Synchronize tab_data into our map's dictionary
 
         # 2. Handle "Untitled" Files / "Save As"
         if current_path is None or save_as:
@@ -952,11 +1229,9 @@ class MainWindow(QMainWindow):
                 return False
             
             current_path = new_path
-            tab_data["path"] = current_path # This updates the dictionary in self.tab_data_map
-            editor.file_path = current_path # Keep editor's own file_path in sync
+            self._set_editor_file_path(editor, current_path, tab_data) # Keeps tab_data and the editor in sync
             # No self.tab_widget.setTabData needed as self.tab_data_map[editor] = tab_data is done if it was None,
             # or tab_data is a reference to the dict in the map.
-            editor._update_language_and_highlighting()
             if hasattr(self, 'file_explorer') and self.file_explorer:
                 self.file_explorer.refresh_tree()
 
@@ -970,12 +1245,14 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage(f"Formatting and saving '{os.path.basename(current_path)}'...")
 
         # 4. Perform Synchronous Formatting (for Python files)
-        original_text = editor.toPlainText()
+        original_text = editor.plain_text()
         formatted_text = original_text
 
-        if current_path.lower().endswith(".py"):
+        # Black is synchronous here because callers (Save, closeEvent) need the result; skip it when
+        # the document hasn't changed since it was last formatted (e.g. Format Code, then Save).
+        if current_path.lower().endswith(".py") and original_text != editor.formatted_text:
             try:
-                formatted_text = black.format_str(original_text, mode=black.FileMode())
+                formatted_text = black.format_str(original_text, mode=BLACK_MODE)
             except black.parsing.LibCSTError as e:
                 QMessageBox.critical(self, "Formatting Error", f"Syntax error in Python code. Cannot format and save:\n{e}")
                 QApplication.restoreOverrideCursor()
@@ -992,8 +1269,14 @@ class MainWindow(QMainWindow):
             dir_name = os.path.dirname(current_path)
             if dir_name:
                 os.makedirs(dir_name, exist_ok=True)
-            with open(current_path, 'w', encoding='utf-8') as f:
-                f.write(formatted_text)
+            # QSaveFile writes to a temporary file and renames it over the target on commit(),
+            # so a failed or interrupted save never leaves a truncated file behind.
+            save_file = QSaveFile(current_path)
+            if not save_file.open(QIODevice.WriteOnly | QIODevice.Text):
+                raise IOError(save_file.errorString())
+            save_file.write(formatted_text.encode('utf-8'))
+            if not save_file.commit():
+                raise IOError(save_file.errorString())
         except (IOError, PermissionError) as e:
             QMessageBox.critical(self, "File Save Error", f"Could not write to disk: '{current_path}'.\nError: {e}")
             QApplication.restoreOverrideCursor()
@@ -1007,20 +1290,19 @@ class MainWindow(QMainWindow):
 
         # 6. Finalize State on Success
         self.is_updating_from_network = True
-        current_cursor_pos = editor.textCursor().position()
-        editor.setPlainText(formatted_text)
-        new_cursor = editor.textCursor()
-        new_cursor.setPosition(min(current_cursor_pos, len(formatted_text)))
-        editor.setTextCursor(new_cursor)
+        editor.apply_text_diff(formatted_text) # Only touches reformatted lines; keeps undo and cursor
         self.is_updating_from_network = False
+        if current_path.lower().endswith(".py"):
+            editor.formatted_text = formatted_text
         
         tab_data["is_dirty"] = False # This updates the dictionary in self.tab_data_map
+        self._dirty_editors.discard(editor)
         # tab_data["path"] = current_path # Path is already updated in tab_data
         # self.tab_data_map[editor] = tab_data # This ensures the map has the latest state.
                                             # If tab_data is a reference to the dict in the map,
                                             # this explicit assignment might be redundant but safe.
         
-        new_tab_title = os.path.basename(current_path)
+        new_tab_title = editor._base_name
         self.tab_widget.setTabText(index, new_tab_title)
         self.tab_widget.setTabToolTip(index, current_path) # Set full path as tooltip
         
@@ -1039,49 +1321,55 @@ class MainWindow(QMainWindow):
         if current_index == -1:
             return
 
-        code_text = current_editor.toPlainText()
+        code_text = current_editor.plain_text()
         # Get tab_data from the map
         tab_data = self.tab_data_map.get(current_editor)
         file_path = tab_data.get("path") if tab_data else None
 
         # Only attempt to format if it's a Python file
         if file_path and file_path.lower().endswith(".py"):
-            QApplication.setOverrideCursor(Qt.WaitCursor)
+            if file_path in self._pending_formats:
+                # One run per file at a time; a second would replace the entry the first one is checked against.
+                self.status_bar.showMessage("Already formatting this file...")
+                return
             self.statusBar().showMessage("Formatting code...")
-            try:
-                formatted_text = black.format_str(code_text, mode=black.FileMode())
-                current_editor.setPlainText(formatted_text) # This will trigger on_text_editor_changed
-                self.status_bar.showMessage("Code formatted.")
-                
-                # Mark as dirty in self.tab_data_map if formatting changed the text
-                # on_text_editor_changed will handle the asterisk if it's a new change
-                if tab_data: # Ensure tab_data was found
-                    if original_text != formatted_text and not tab_data.get("is_dirty", False):
-                        tab_data["is_dirty"] = True
-                        # Update tab title with asterisk if not already there
-                        # This part is tricky as on_text_editor_changed also does this.
-                        # To avoid double-asterisk or complex logic, let on_text_editor_changed handle it.
-                        # We just ensure the dirty flag is set in our map.
-                        # current_tab_text = self.tab_widget.tabText(current_index)
-                        # if not current_tab_text.endswith("*"):
-                        #    self.tab_widget.setTabText(current_index, current_tab_text + "*")
-                
-            except black.parsing.LibCSTError as e:
-                self.status_bar.showMessage("Formatting failed: Syntax error.")
-                QMessageBox.critical(self, "Formatting Error", f"Syntax error in code. Cannot format:\n{e}")
-            except Exception as e:
-                self.status_bar.showMessage("Formatting failed.")
-                QMessageBox.critical(self, "Formatting Error", f"Failed to format code with Black:\n{e}")
-            finally:
-                QApplication.restoreOverrideCursor()
+            # Black runs on the thread pool; remember the source text so a stale result is never applied.
+            # (document().revision() can repeat after an undo, so it can't identify the text.)
+            self._pending_formats[file_path] = (current_editor, code_text)
+            worker = BlackFormatterWorker(code_text, file_path, current_index)
+            worker.signals.finished.connect(self._on_format_finished)
+            worker.signals.error.connect(self._on_format_error)
+            self.threadpool.start(worker)
         else:
             self.status_bar.showMessage("Formatting is only supported for Python files (.py).")
 
+    @Slot(str, str, int)
+    def _on_format_finished(self, formatted_text, file_path, editor_index):
+        editor, source_text = self._pending_formats.pop(file_path, (None, None))
+        if editor is None or editor not in self.tab_data_map:
+            return # Tab was closed while Black was running
+        if editor.plain_text() != source_text:
+            self.status_bar.showMessage("Code changed while formatting. Formatting result discarded.")
+            return
+        if editor.isReadOnly():
+            self.status_bar.showMessage("Editing control changed while formatting. Formatting result discarded.")
+            return
+
+        editor.apply_text_diff(formatted_text) # on_text_editor_changed marks this editor dirty
+        editor.formatted_text = formatted_text
+        self.status_bar.showMessage("Code formatted.")
+
+    @Slot(str, str, int)
+    def _on_format_error(self, error_message, file_path, editor_index):
+        self._pending_formats.pop(file_path, None)
+        self.status_bar.showMessage("Formatting failed.")
+        QMessageBox.critical(self, "Formatting Error", error_message)
+
 
     def save_session(self):
         session_data = {}
         try:
-            root_path = self.file_explorer.model().rootPath()
+            root_path = self.file_explorer.root_path() # Includes a root not yet applied to the model
             open_files = []
             for i in range(self.tab_widget.count()):
                 editor = self.tab_widget.widget(i)
@@ -1159,16 +1447,11 @@ class MainWindow(QMainWindow):
                 self.open_new_tab() # Ensure at least one tab is open
 
     def closeEvent(self, event):
-        unsaved_changes_exist = False
-        for i in range(self.tab_widget.count()):
-            editor = self.tab_widget.widget(i)
-            if isinstance(editor, CodeEditor):
-                tab_data = self.tab_data_map.get(editor)
-                if tab_data and tab_data.get("is_dirty", False):
-                    unsaved_changes_exist = True
-                    break
-
-        if unsaved_changes_exist:
+        # Resolve the dirty tabs before any teardown, so that cancelling the
+        # prompt (or a failed save) leaves the running process and session untouched.
+        dirty_indices = sorted(self.tab_widget.indexOf(editor) for editor in self._dirty_editors)
+
+        if dirty_indices:
             reply = QMessageBox.question(self, "Unsaved Changes",
                                          "You have unsaved changes. Do you want to save them before closing?",
                                          QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel,
@@ -1180,26 +1463,33 @@ class MainWindow(QMainWindow):
             elif reply == QMessageBox.Save:
                 # Store current index to restore it later
                 original_current_index = self.tab_widget.currentIndex()
-                
-                for i in range(self.tab_widget.count()):
-                    editor = self.tab_widget.widget(i) # Get editor for the tab
-                    if isinstance(editor, CodeEditor):
-                        tab_data = self.tab_data_map.get(editor) # Get its data from the map
-                        if tab_data and tab_data.get("is_dirty", False):
-                            # Temporarily set the current index to the tab to be saved
-                            # This ensures _save_file operates on the correct tab
-                            self.tab_widget.setCurrentIndex(i)
-                        if not self._save_file(i): # If save is cancelled
-                            event.ignore()
-                            return # Stop processing and prevent close
-                
+
+                for i in dirty_indices:
+                    # _save_file works on the index it is given; only switch tabs when a
+                    # Save As dialog will ask about this one, so the user can see which file it is.
+                    if self.tab_data_map[self.tab_widget.widget(i)].get("path") is None:
+                        self.tab_widget.setCurrentIndex(i)
+                    if not self._save_file(i): # If save is cancelled
+                        event.ignore()
+                        return # Stop processing and prevent close
+
                 # Restore original current index if it's still valid
                 if 0 <= original_current_index < self.tab_widget.count():
                     self.tab_widget.setCurrentIndex(original_current_index)
-        
-        # Only save the session and accept the close event if all saves were successful or discarded
-        self.save_session()
-        event.accept()
+
+        # The close is now committed: tear down, but always save the session and accept.
+        try:
+            self._network_flush_timer.stop()
+            process = getattr(self, 'process', None)
+            if process is not None and process.state() != QProcess.NotRunning:
+                # SIGKILL needs no grace period; reap asynchronously instead of blocking the close.
+                process.finished.connect(process.deleteLater)
+                process.kill()
+            if self.network_manager.is_connected():
+                self.network_manager.stop_session()
+        finally:
+            self.save_session()
+            event.accept()
 
     @Slot(QPoint)
     def on_file_tree_context_menu(self, position):
@@ -1223,11 +1513,10 @@ class MainWindow(QMainWindow):
 
     def _find_editor_for_path(self, file_path):
         """Helper to find an open CodeEditor tab for a given file path."""
-        for i in range(self.tab_widget.count()):
-            editor = self.tab_widget.widget(i)
-            if isinstance(editor, CodeEditor) and editor.file_path == file_path:
-                return editor, i
-        return None, -1
+        editor = self._open_paths.get(file_path)
+        if editor is None:
+            return None, -1
+        return editor, self.tab_widget.indexOf(editor)
 
     def _rename_file_folder(self, index):
         model = self.file_explorer.model
@@ -1251,12 +1540,9 @@ class MainWindow(QMainWindow):
             editor, tab_idx = self._find_editor_for_path(old_path) # Renamed tab_index to tab_idx
             if editor:
                 tab_data_for_editor = self.tab_data_map.get(editor) # Get from map
-                if tab_data_for_editor: # Check if found in map
-                    tab_data_for_editor["path"] = new_path
-                    # tab_data_for_editor["is_dirty"] could be set if needed, e.g. if rename dirties.
-                # Update editor's internal file_path as well
-                editor.file_path = new_path
-                self.tab_widget.setTabText(tab_idx, os.path.basename(new_path))
+                # Updates the map entry (if found) and the editor's internal file_path
+                self._set_editor_file_path(editor, new_path, tab_data_for_editor)
+                self.tab_widget.setTabText(tab_idx, editor._base_name)
                 self.tab_widget.setTabToolTip(tab_idx, new_path) # Update tooltip as well
             
             try:
@@ -1276,14 +1562,12 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             try:
                 # Close any open tabs related to the deleted file/folder
-                tabs_to_close = []
-                for i in range(self.tab_widget.count()):
-                    editor = self.tab_widget.widget(i)
-                    if isinstance(editor, CodeEditor) and editor.file_path:
-                        if os.path.isfile(path_to_delete) and editor.file_path == path_to_delete:
-                            tabs_to_close.append(i)
-                        elif os.path.isdir(path_to_delete) and editor.file_path.startswith(path_to_delete):
-                            tabs_to_close.append(i)
+                if os.path.isdir(path_to_delete):
+                    folder_prefix = path_to_delete.rstrip("/\\") + "/" # Qt paths use "/"; the slash keeps sibling "name2/" out
+                    editors = [editor for path, editor in self._open_paths.items() if path.startswith(folder_prefix)]
+                else:
+                    editors = [self._open_paths[path_to_delete]] if path_to_delete in self._open_paths else []
+                tabs_to_close = [self.tab_widget.indexOf(editor) for editor in editors]
                 
                 # Close tabs in reverse order to avoid index issues
                 for i in sorted(tabs_to_close, reverse=True):
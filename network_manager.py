@@ -1,12 +1,20 @@
-from PySide6.QtCore import QObject, Signal, Slot, QByteArray
-from PySide6.QtNetwork import QTcpServer, QTcpSocket, QHostAddress
+from PySide6.QtCore import QObject, Signal, Slot
+from PySide6.QtNetwork import QTcpServer, QTcpSocket, QHostAddress, QAbstractSocket
 import json # Import json for structured messages
+import logging
+import zlib
+import base64
+
+log = logging.getLogger(__name__)
 
 class NetworkManager(QObject):
     data_received = Signal(str) # For raw text content
+    diff_received = Signal(int, int, str, int) # start, end, replacement, base_length (UTF-16 positions)
+    sync_requested = Signal() # Peer's document diverged; it needs a full TEXT_UPDATE
     status_changed = Signal(str)
     peer_connected = Signal()
     peer_disconnected = Signal()
+    peer_count_changed = Signal(int) # Number of connected peers (0 or 1)
     
     # New signals for control messages
     control_request_received = Signal()
@@ -14,6 +22,8 @@ class NetworkManager(QObject):
     control_declined = Signal() # New signal for declined control
     control_revoked = Signal()
 
+    COMPRESS_THRESHOLD = 4096 # Characters; smaller snapshots aren't worth the zlib + base64 round trip
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.tcp_server = QTcpServer(self)
@@ -54,6 +64,7 @@ class NetworkManager(QObject):
                 self.peer_socket.disconnectFromHost()
                 self.peer_socket.waitForDisconnected(1000)
                 self.peer_socket = None
+            self.peer_count_changed.emit(0)
             self.status_changed.emit("Hosting session stopped.")
         elif self.tcp_socket.state() == QTcpSocket.ConnectedState:
             self.tcp_socket.disconnectFromHost()
@@ -66,28 +77,40 @@ class NetworkManager(QObject):
     def _on_new_connection(self):
         if self.peer_socket: # Only allow one peer for simplicity
             new_socket = self.tcp_server.nextPendingConnection()
+            # Don't block the GUI thread waiting on a remote party; free the socket once it has closed.
+            new_socket.disconnected.connect(new_socket.deleteLater)
             new_socket.disconnectFromHost()
-            new_socket.waitForDisconnected(1000)
             self.status_changed.emit("Rejected new connection: already have a peer.")
             return
 
         self.peer_socket = self.tcp_server.nextPendingConnection()
+        self._configure_socket(self.peer_socket)
         self.peer_socket.readyRead.connect(self._read_data)
         self.peer_socket.disconnected.connect(self._on_peer_disconnected)
         self.status_changed.emit(f"Peer connected from {self.peer_socket.peerAddress().toString()}:{self.peer_socket.peerPort()}")
         self.peer_connected.emit()
-        self.buffer[self.peer_socket] = "" # Initialize buffer for new peer
+        self.peer_count_changed.emit(1)
+        self.buffer[self.peer_socket] = bytearray() # Initialize buffer for new peer
+
+    @staticmethod
+    def _configure_socket(socket):
+        # Edits are small, latency-sensitive writes: don't let Nagle hold them back waiting for an ACK.
+        socket.setSocketOption(QAbstractSocket.LowDelayOption, 1)
+        socket.setSocketOption(QAbstractSocket.KeepAliveOption, 1) # Notice peers that vanish without a FIN
 
     @Slot()
     def _on_connected(self):
+        self._configure_socket(self.tcp_socket)
         self.status_changed.emit(f"Connected to host {self.tcp_socket.peerAddress().toString()}:{self.tcp_socket.peerPort()}")
         self.peer_connected.emit()
-        self.buffer[self.tcp_socket] = "" # Initialize buffer for client socket
+        self.peer_count_changed.emit(1)
+        self.buffer[self.tcp_socket] = bytearray() # Initialize buffer for client socket
 
     @Slot()
     def _on_disconnected(self):
         self.status_changed.emit("Disconnected from host.")
         self.peer_disconnected.emit()
+        self.peer_count_changed.emit(0)
         if self.tcp_socket in self.buffer:
             del self.buffer[self.tcp_socket]
 
@@ -100,32 +123,46 @@ class NetworkManager(QObject):
             self.peer_socket = None
         self.status_changed.emit("Peer disconnected.")
         self.peer_disconnected.emit()
+        self.peer_count_changed.emit(0)
 
     @Slot()
     def _read_data(self):
         sender_socket = self.sender() # Get the socket that emitted the signal
         if isinstance(sender_socket, QTcpSocket):
             raw_data = sender_socket.readAll().data()
-            # Decode raw data and append to buffer for the specific socket
-            decoded_data = raw_data.decode('utf-8', errors='ignore')
-            print(f"5. readyRead triggered. Received raw data: {decoded_data}")
-            
-            self.buffer[sender_socket] += decoded_data
-            
+            log.debug("readyRead: received %d bytes", len(raw_data))
+
+            # Buffer raw bytes: a TCP read can end mid UTF-8 sequence, so frames are only decoded once complete.
+            buffer = self.buffer[sender_socket]
+            buffer += raw_data
+            # Only the new bytes can hold a new frame terminator; don't rescan a large partial frame.
+            end = raw_data.rfind(b'\n')
+            if end == -1:
+                return
+            end += len(buffer) - len(raw_data)
+            complete = bytes(buffer[:end])
+            del buffer[:end + 1]
+
             # Process messages from the buffer
-            while '\n' in self.buffer[sender_socket]:
-                message_str, self.buffer[sender_socket] = self.buffer[sender_socket].split('\n', 1)
+            for message_str in complete.split(b'\n'):
                 if not message_str.strip(): # Handle empty lines
                     continue
  
                 try:
-                    message = json.loads(message_str)
-                    print(f"6. Parsed message in NetworkManager: {message}")
+                    message = json.loads(message_str) # json.loads decodes UTF-8 bytes itself
                     msg_type = message.get('type')
+                    log.debug("Parsed %s message", msg_type)
                     if msg_type == 'TEXT_UPDATE':
                         content = message.get('content', '')
-                        print(f"7. Emitting data_received with content: {content[:50]}...")
                         self.data_received.emit(content)
+                    elif msg_type == 'TEXT_UPDATE_Z':
+                        content = zlib.decompress(base64.b64decode(message['content'])).decode('utf-8')
+                        self.data_received.emit(content)
+                    elif msg_type == 'TEXT_DIFF':
+                        delta = message.get('content', {})
+                        self.diff_received.emit(delta['start'], delta['end'], delta['text'], delta['base_length'])
+                    elif msg_type == 'REQ_SYNC':
+                        self.sync_requested.emit()
                     elif msg_type == 'REQ_CONTROL':
                         self.control_request_received.emit()
                     elif msg_type == 'GRANT_CONTROL':
@@ -135,22 +172,29 @@ class NetworkManager(QObject):
                     elif msg_type == 'REVOKE_CONTROL':
                         self.control_revoked.emit()
                     else:
-                        print(f"NetworkManager: Unknown message type received: {msg_type}")
+                        log.warning("Unknown message type received: %s", msg_type)
                 except json.JSONDecodeError:
-                    print(f"NetworkManager: Received non-JSON data or incomplete JSON in buffer: {message_str}")
+                    log.warning("Received non-JSON frame (%d bytes)", len(message_str))
                 except Exception as e:
-                    print(f"NetworkManager: Error processing received data from buffer: {e}")
+                    log.warning("Error processing received frame: %s", e)
 
-    def send_data(self, message_type, content=None):
-        print(f"LOG: NetworkManager.send_data - Entry, Type: {message_type}")
+    @staticmethod
+    def _frame_message(message_type, content=None):
+        """Serializes a message straight to newline-delimited UTF-8 bytes, ready for socket.write()."""
         message = {'type': message_type}
         if content is not None:
             message['content'] = content
-        
-        # Add a newline delimiter to ensure messages are properly separated for buffering
-        json_message = json.dumps(message) + '\n'
-        data = QByteArray(json_message.encode('utf-8'))
-        print(f"3. Formatting message: {json_message.strip()}") # Strip newline for cleaner log
+        # json.dumps escapes all control characters, so the newline delimiter can never appear inside a frame.
+        # ensure_ascii=False keeps non-ASCII text as 1-4 UTF-8 bytes instead of 6-12 byte \u escapes.
+        return json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def send_data(self, message_type, content=None):
+        if message_type == 'TEXT_UPDATE' and content and len(content) >= self.COMPRESS_THRESHOLD:
+            # Full snapshots are mostly source text, which zlib shrinks several-fold even at level 1.
+            message_type = 'TEXT_UPDATE_Z'
+            content = base64.b64encode(zlib.compress(content.encode('utf-8'), 1)).decode('ascii')
+        data = self._frame_message(message_type, content)
+        log.debug("Sending %s (%d bytes)", message_type, len(data))
  
         # Determine which socket to use based on whether we are a client or a server
         target_socket = None
@@ -162,14 +206,11 @@ class NetworkManager(QObject):
         if target_socket:
             try:
                 target_socket.write(data)
-                print(f"4. Data written to socket.")
-                print(f"LOG: NetworkManager.send_data - Data sent via {target_socket.objectName()}: {message_type}")
             except Exception as e:
-                print(f"LOG: NetworkManager.send_data - Error writing to socket: {e}")
+                log.warning("Error writing to socket: %s", e)
                 self.status_changed.emit(f"Network error: {e}")
         else:
-            print("LOG: NetworkManager.send_data - No active connection to send data.")
-        print("LOG: NetworkManager.send_data - Exit")
+            log.debug("No active connection to send %s", message_type)
 
     def is_connected(self):
         return self.tcp_socket.state() == QTcpSocket.ConnectedState or \
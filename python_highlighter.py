@@ -4,6 +4,9 @@ from pygments.lexers import get_lexer_by_name, guess_lexer_for_filename
 from pygments.util import ClassNotFound
 
 class PythonHighlighter(QSyntaxHighlighter):
+    # Pygments token type -> key in self.formats. Theme independent, so every editor shares one table.
+    _token_format_keys = {}
+
     def __init__(self, document, theme_config=None):
         super().__init__(document)
         self.formats = {}
@@ -33,21 +36,30 @@ class PythonHighlighter(QSyntaxHighlighter):
                 fmt.setFontWeight(QFont.Bold)
             self.formats[token_type] = fmt
 
+    def _format_key(self, token_type):
+        key = self._token_format_keys.get(token_type)
+        if key is None:
+            # Walk up the token hierarchy, e.g. Literal.String.Double -> 'string', Keyword.Constant -> 'keyword'.
+            key = "default"
+            node = token_type
+            while node:
+                name = node[-1].lower()
+                if name in self.formats:
+                    key = name
+                    break
+                node = node.parent
+            self._token_format_keys[token_type] = key
+        return key
+
     def highlightBlock(self, text):
         if not self.lexer:
             return
 
         try:
-            offset = 0
-            for token, content in self.lexer.get_tokens_unprocessed(text):
-                token_type = str(token).split('.')[-1].lower() # e.g., 'Token.Keyword' -> 'keyword'
-                
-                # Map Pygments token types to our defined formats
-                fmt = self.formats.get(token_type, self.formats.get("default"))
-                
-                # Apply format
-                self.setFormat(offset, len(content), fmt)
-                offset += len(content)
+            formats = self.formats
+            # get_tokens_unprocessed yields (index, token_type, value) triples.
+            for index, token_type, content in self.lexer.get_tokens_unprocessed(text):
+                self.setFormat(index, len(content), formats[self._format_key(token_type)])
         except Exception as e:
             # Fallback to default if Pygments fails for some reason
             print(f"Pygments highlighting error: {e}")
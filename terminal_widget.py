@@ -1,12 +1,14 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QLineEdit
-from PySide6.QtCore import QProcess, Signal, Slot
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QTextEdit, QLineEdit, QApplication
+from PySide6.QtCore import QProcess, Signal, Slot, QThreadPool
 from PySide6.QtGui import QTextCursor, QTextCharFormat, QColor
 import sys
 import os
 import tempfile
+import contextlib
 
 class TerminalWidget(QWidget):
     output_received = Signal(str)
+    _cleanup_pool = None # QThreadPool for temp file deletion, created on first use
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -222,10 +224,25 @@ class TerminalWidget(QWidget):
             self.append_output("Type a command to restart the shell.\n") # Prompt user to restart shell
 
     def _cleanup_temp_files(self, temp_file_path, selected_language):
-        """Helper to clean up temporary files."""
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+        """Schedules removal of temporary files on the cleanup thread pool."""
+        pool = TerminalWidget._cleanup_pool
+        if pool is None:
+            # Own pool, so quitting waits only for deletions, not for editor completion/lint workers.
+            pool = TerminalWidget._cleanup_pool = QThreadPool()
+            pool.setMaxThreadCount(1)
+            QApplication.instance().aboutToQuit.connect(pool.waitForDone)
+        pool.start(lambda: TerminalWidget._remove_temp_files(temp_file_path, selected_language))
+
+    @staticmethod
+    def _remove_temp_files(temp_file_path, selected_language):
+        """Deletes temporary files. Runs off the GUI thread, so it must only touch the filesystem."""
+        paths = [temp_file_path]
         if selected_language == "C++":
             output_file = os.path.splitext(temp_file_path)[0]
-            if os.path.exists(output_file):
-                os.unlink(output_file)
\ No newline at end of file
+            paths.append(output_file)
+            if sys.platform.startswith('win'):
+                paths.append(output_file + ".exe")
+        for path in paths:
+            # One unlink per file; a missing or locked file is simply left alone.
+            with contextlib.suppress(OSError):
+                os.unlink(path)
\ No newline at end of file
@@ -0,0 +1,57 @@
+# text_delta.py
+# Helpers for describing an edit as a single replaced span, used to send
+# incremental TEXT_DIFF messages instead of full document snapshots.
+#
+# Positions handed to Qt (QTextCursor, QTextDocument.characterCount) count
+# UTF-16 code units, while Python indexes strings by code point. The two only
+# agree for text without characters outside the Basic Multilingual Plane, so
+# every position that goes on the wire is converted with utf16_len().
+
+
+def utf16_len(text):
+    """Length of text in UTF-16 code units, i.e. in QTextCursor positions."""
+    if text.isascii(): # O(1) for compact ASCII strings
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _common_prefix_length(a, b):
+    # Binary search on slice equality keeps the comparisons in C.
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(a, b, limit):
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def compute_text_delta(old_text, new_text):
+    """
+    Returns (start, end, replacement) in Python indices such that
+    old_text[:start] + replacement + old_text[end:] == new_text.
+    """
+    prefix = _common_prefix_length(old_text, new_text)
+    limit = min(len(old_text), len(new_text)) - prefix
+    suffix = _common_suffix_length(old_text, new_text, limit)
+    return prefix, len(old_text) - suffix, new_text[prefix:len(new_text) - suffix]
+
+
+def compute_qt_text_delta(old_text, new_text):
+    """Like compute_text_delta, but start/end are UTF-16 positions suitable for QTextCursor."""
+    start, end, replacement = compute_text_delta(old_text, new_text)
+    if old_text.isascii():
+        return start, end, replacement
+    return utf16_len(old_text[:start]), utf16_len(old_text[:end]), replacement
@@ -2,6 +2,8 @@ from PySide6.QtCore import QRunnable, QObject, Signal
 import black
 import traceback
 
+BLACK_MODE = black.FileMode() # Default Black settings; immutable, so one instance is shared across threads
+
 class BlackFormatterSignals(QObject):
     """
     Defines the signals available from a running BlackFormatterWorker.
@@ -26,8 +28,7 @@ class BlackFormatterWorker(QRunnable):
         """
         try:
             # Use black.format_str for formatting a string
-            # mode=black.FileMode() uses default black settings
-            formatted_code = black.format_str(self.code_text, mode=black.FileMode())
+            formatted_code = black.format_str(self.code_text, mode=BLACK_MODE)
             self.signals.finished.emit(formatted_code, self.file_path, self.editor_index)
         except black.parsing.LibCSTError as e:
             # Specific error for syntax issues that black can't parse